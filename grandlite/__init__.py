@@ -1,50 +1,94 @@
+from __future__ import annotations
+
 import argparse
+import contextlib
 import csv
+import gzip
+import hashlib
+import io
+import os
 import pathlib
+import pickle
+import queue
 import sys
 import re
 import tempfile
+import threading
+import warnings
+from typing import TYPE_CHECKING, BinaryIO, Iterator
 
-import networkx as nx
-import requests
-from prompt_toolkit import HTML, PromptSession, print_formatted_text
-from grand_cypher_io import opencypher_buffers_to_graph
+# Heavy dependencies are imported where they are used, so that `--help` and
+# argument errors don't pay for them.
+if TYPE_CHECKING:
+    import networkx as nx
 
-from .prompts import ALL_PROMPTS, StatefulPrompt
+from .prompts import ALL_PROMPTS, StatefulPrompt, _fast_to_json
 
 _opencypher_graphpath_regex = re.compile(r"vertex:(.*);edge:(.*)")
+_headered_edgelist_regex = re.compile(r"h-edgelist\((.*):(.*)\)://(.*)")
+_gml_header_regex = re.compile(rb"^\s*graph\s*\[", re.MULTILINE)
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# Filename suffixes that identify a graph file type, checked in order (longest
+# first, so that compound suffixes win over their tails).
+_SUFFIX_TYPES = (
+    (".graphml.gz", "graphml"),
+    (".gml.gz", "gml"),
+    (".edgelist", "edgelist"),
+    (".gpickle", "gpickle"),
+    (".graphml", "graphml"),
+    (".gml", "gml"),
+)
+
+# Inputs that end an interactive session.
+_EXIT_TOKENS = frozenset({"exit", "exit()", "quit", "quit()", "q"})
 
 results_formatter = {
-    "csv": lambda x: x.to_csv(sys.stdout),
-    "json": lambda x: x.to_json(sys.stdout, orient="records"),
-    "jsonl": lambda x: x.to_json(sys.stdout, orient="records", lines=True),
+    "json": lambda x: _fast_to_json(x, sys.stdout.buffer),
+    "jsonl": lambda x: _fast_to_json(x, sys.stdout.buffer, lines=True),
 }
 
 
-def _guess_delimiter(first_n_lines: list[str]) -> str:
+def _write_csv_records(columns: list[str], records: Iterator[dict]):
+    """
+    Write result records to stdout as CSV, one row at a time.
+
+    The header is always written, even if there are no records.
+
+    Arguments:
+        columns: The column names of the results.
+        records: An iterator of result rows, as dicts.
+
+    """
+    writer = csv.DictWriter(sys.stdout, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(records)
+
+
+def _guess_delimiter(first_n_lines: list[bytes]) -> str:
     """
     Guess the delimiter of a CSV file from the first few lines.
 
     Arguments:
-        first_n_lines: The first few lines of the CSV file.
+        first_n_lines: The first few lines of the CSV file, as raw bytes.
 
     Returns:
         The guessed delimiter.
 
     """
-    delimiters = [",", "\t", ";", "|"]
-    # Return the first delimiter that appears in the first few lines and has
-    # the same number of occurrences in each line.
-    for delimiter in delimiters:
-        # Appears at all?
-        if not any(delimiter in line for line in first_n_lines):
-            continue
-        if all(
-            line.count(delimiter) == first_n_lines[0].count(delimiter)
-            for line in first_n_lines
-        ):
-            return delimiter
-    raise ValueError("Could not guess delimiter.")
+    lines = [line for line in first_n_lines if line.strip()]
+    # Keep the candidates that occur the same, non-zero number of times on
+    # every line, and of those pick the most frequent one (ties go to the
+    # earlier candidate).
+    candidates = []
+    for i, delimiter in enumerate(b",\t;|"):
+        counts = {line.count(delimiter) for line in lines}
+        if len(counts) == 1 and 0 not in counts:
+            candidates.append((counts.pop(), -i, delimiter))
+    if not candidates:
+        raise ValueError("Could not guess delimiter.")
+    return chr(max(candidates)[2])
 
 
 def read_headered_edgelist(filename: str) -> nx.Graph:
@@ -61,24 +105,114 @@ def read_headered_edgelist(filename: str) -> nx.Graph:
     # The filename is of the form `h-edgelist(src:tgt)://{filename}`, so we
     # need to extract the the src column and tgt column from the filename,
     # and then read the file.
-    match = re.match(r"h-edgelist\((.*):(.*)\)://(.*)", filename)
+    import networkx as nx
+
+    match = _headered_edgelist_regex.match(filename)
     if match is None:
         raise ValueError("Invalid headered edgelist file path.")
     src_col = match.group(1)
     tgt_col = match.group(2)
     filepath = match.group(3)
 
-    # The file has a header row.
-    # Use the CSV reader to read the file:
-    def _without_srctgt(row):
-        return {k: v for k, v in row.items() if k not in [src_col, tgt_col]}
+    try:
+        import polars as pl
+    except ImportError:
+        pl = None
+
+    with open(filepath, "rb") as f:
+        delimiter = _guess_delimiter([f.readline() for _ in range(5)])
+
+        if pl is None:
+            # The file has a header row.
+            # Use the CSV reader to read the file, rewinding the handle we
+            # sniffed with rather than opening the file a second time. Stream
+            # rows straight into the graph so that only one row is alive at a
+            # time, rather than materializing the full edge list first.
+            f.seek(0)
+            reader = csv.DictReader(
+                io.TextIOWrapper(f, newline=""), delimiter=delimiter
+            )
+            extra_cols = [
+                c for c in reader.fieldnames or [] if c not in (src_col, tgt_col)
+            ]
+            graph = nx.DiGraph()
+            if not extra_cols:
+                # No attribute columns, so don't allocate an empty dict per edge:
+                graph.add_edges_from((row[src_col], row[tgt_col]) for row in reader)
+            else:
+                graph.add_edges_from(
+                    (row[src_col], row[tgt_col], {c: row[c] for c in extra_cols})
+                    for row in reader
+                )
+            return graph
+
+    # Parse the whole file in one vectorized pass. polars is given the path
+    # rather than the open handle so that it can memory-map the file. All
+    # columns are read as strings so that node IDs match the ones the CSV
+    # reader produces, with empty cells read as empty strings rather than
+    # nulls for the same reason.
+    df = pl.read_csv(filepath, separator=delimiter, infer_schema_length=0).fill_null("")
+    src = df[src_col].to_list()
+    tgt = df[tgt_col].to_list()
+    attrs = df.drop([src_col, tgt_col])
+    if attrs.width == 0:
+        return nx.from_edgelist(zip(src, tgt), create_using=nx.DiGraph)
+    # Pull each attribute column out as a whole and zip them back together
+    # into per-edge dicts, rather than asking polars for one row at a time.
+    names = attrs.columns
+    columns = [attrs[name].to_list() for name in names]
+    graph = nx.DiGraph()
+    graph.add_edges_from(
+        (u, v, dict(zip(names, values))) for u, v, *values in zip(src, tgt, *columns)
+    )
+    return graph
+
+
+def _type_from_ext(filename: str) -> str | None:
+    """
+    Infer the graph file type from the filename or URI prefix alone.
+
+    Arguments:
+        filename: The name of the graph file.
+
+    Returns:
+        The file type, as a string, or None if it cannot be inferred.
 
-    with open(filepath, "r") as f:
-        delimiter = _guess_delimiter([next(f) for _ in range(5)])
-    with open(filepath, "r") as f:
-        reader = csv.DictReader(f, delimiter=delimiter)
-        edges = [(row[src_col], row[tgt_col], _without_srctgt(row)) for row in reader]
-    return nx.DiGraph(edges)
+    """
+    # URI prefixes name the reader explicitly, so they win over the suffix of
+    # the path they wrap (e.g. `h-edgelist(src:tgt)://edges.edgelist`):
+    if _headered_edgelist_regex.match(filename):
+        return "edgelist-with-headers"
+    if filename.startswith("edgelist://"):
+        return "edgelist"
+    for suffix, graph_type in _SUFFIX_TYPES:
+        if filename.endswith(suffix):
+            return graph_type
+    return None
+
+
+def _read_head(filename: str, size: int = 512) -> bytes:
+    """
+    Read the first bytes of a file without decoding them.
+
+    Arguments:
+        filename: The name of the file to read.
+        size: The maximum number of bytes to read.
+
+    Returns:
+        The first (up to) `size` bytes of the file.
+
+    """
+    if not hasattr(os, "pread"):
+        with open(filename, "rb") as f:
+            return f.read(size)
+    # Read straight from the file descriptor, skipping the buffered file
+    # object entirely.
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        return os.pread(fd, size, 0)
+    finally:
+        os.close(fd)
 
 
 def _infer_graph_filetype_from_contents(filename: str) -> str:
@@ -97,13 +231,26 @@ def _infer_graph_filetype_from_contents(filename: str) -> str:
     """
     # Make sure the file exists:
     if pathlib.Path(filename).exists():
+        first_bytes = _read_head(filename)
+        # If gzipped, sniff the decompressed contents instead:
+        if first_bytes.startswith(_GZIP_MAGIC):
+            with gzip.open(filename, "rb") as f:
+                first_bytes = f.read(512)
+
         # If XML, assume GraphML
-        first_chars = open(filename).read(500)
-        if "<graphml" in first_chars:
+        if b"<graphml" in first_bytes:
             return "graphml"
 
+        # GML files open with a `graph [` block (possibly after comments):
+        if _gml_header_regex.search(first_bytes):
+            return "gml"
+
+        # Pickles are deliberately never detected from their contents, since
+        # unpickling can run arbitrary code: they are only read from local
+        # files named `.gpickle`.
+
         # If CSV, see if it's an edgelist:
-        if "source,target" in first_chars:
+        if b"source,target" in first_bytes:
             return "edgelist"
 
     # See if this is an OpenCypher collection of the form
@@ -124,6 +271,8 @@ def read_opencypher(paths: str) -> nx.Graph:
         path (str): A path of the form `_opencypher_graphpath_regex`.
 
     """
+    from grand_cypher_io import opencypher_buffers_to_graph
+
     parsed = _opencypher_graphpath_regex.match(paths)
     if parsed is None:
         raise ValueError("Invalid OpenCypher graph path.")
@@ -133,6 +282,98 @@ def read_opencypher(paths: str) -> nx.Graph:
     return opencypher_buffers_to_graph(vertex_paths, edge_paths)
 
 
+def read_gml(filename: str | BinaryIO) -> nx.Graph:
+    """
+    Read a graph from a GML file.
+
+    NetworkX parses GML in pure Python, which is very slow on large files. When
+    python-igraph is installed, its C parser is used instead and the result is
+    copied into a NetworkX graph in bulk. Files that igraph cannot represent
+    faithfully are read with NetworkX instead: gzipped files, open file
+    objects, and files with missing, duplicate or non-string labels, composite
+    (nested) attributes, graph-level attributes (including `multigraph`),
+    parallel edges, or any node or edge attribute that is not a non-empty
+    string on every node or edge. (igraph reads numbers as floats, and can't
+    tell an empty string from a missing attribute.) The igraph path therefore
+    returns exactly the graph `nx.read_gml` would.
+
+    Arguments:
+        filename: The name of the file to read, or an open binary file.
+
+    Returns:
+        A NetworkX graph.
+
+    """
+    import networkx as nx
+
+    try:
+        import igraph
+    except ImportError:
+        return nx.read_gml(filename)
+    if not isinstance(filename, str) or filename.endswith(".gz"):
+        return nx.read_gml(filename)
+
+    # igraph skips composite attributes with a warning, rather than failing:
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        ig_graph = igraph.Graph.Read_GML(filename)
+    if (
+        caught
+        or ig_graph.attributes()
+        or "label" not in ig_graph.vs.attributes()
+        or ig_graph.has_multiple()
+    ):
+        return nx.read_gml(filename)
+    # igraph reads numeric labels as floats, which would change the node IDs:
+    names = ig_graph.vs["label"]
+    if not all(isinstance(name, str) for name in names):
+        return nx.read_gml(filename)
+    if len(set(names)) != len(names):
+        return nx.read_gml(filename)
+
+    node_keys = [k for k in ig_graph.vs.attributes() if k not in ("id", "label")]
+    node_columns = [ig_graph.vs[k] for k in node_keys]
+    edge_keys = ig_graph.es.attributes()
+    edge_columns = [ig_graph.es[k] for k in edge_keys]
+    # igraph stores numbers as floats and fills in attributes that a node or
+    # edge doesn't have with NaN or "", so only plain string columns that are
+    # set on every node or edge survive the round trip unchanged:
+    for column in node_columns + edge_columns:
+        if not all(isinstance(value, str) and value for value in column):
+            return nx.read_gml(filename)
+
+    graph = nx.DiGraph() if ig_graph.is_directed() else nx.Graph()
+    graph.add_nodes_from(
+        (name, dict(zip(node_keys, values)))
+        for name, *values in zip(names, *node_columns)
+    )
+    graph.add_edges_from(
+        (names[u], names[v], dict(zip(edge_keys, values)))
+        for (u, v), *values in zip(ig_graph.get_edgelist(), *edge_columns)
+    )
+    return graph
+
+
+def read_gpickle(filename: str | BinaryIO) -> nx.Graph:
+    """
+    Read a graph from a pickled NetworkX graph.
+
+    Only load pickles from sources you trust, since unpickling can run
+    arbitrary code.
+
+    Arguments:
+        filename: The name of the file to read, or an open binary file.
+
+    Returns:
+        A NetworkX graph.
+
+    """
+    if not isinstance(filename, str):
+        return pickle.load(filename)
+    with open(filename, "rb") as f:
+        return pickle.load(f)
+
+
 def parse_labels_attribute(labels_str: str) -> set:
     """
     Parse a CSV string of labels into a set.
@@ -148,7 +389,138 @@ def parse_labels_attribute(labels_str: str) -> set:
     return set()
 
 
-def detect_and_load_graph(graph_uri: str) -> nx.Graph:
+def _download_to_file(url: str, f: BinaryIO) -> None:
+    """
+    Download a URL into an open binary file.
+
+    The body is streamed in chunks, so the whole file is never held in memory.
+    Chunks are received on a background thread and written on the calling
+    thread, connected by a small bounded queue, so that network and disk I/O
+    overlap.
+
+    Arguments:
+        url: The URL to download.
+        f: The binary file to write the body to.
+
+    Raises:
+        requests.HTTPError: If the server responds with an error status.
+
+    """
+    import requests
+
+    chunks: queue.Queue = queue.Queue(maxsize=8)
+    # Set when the caller stops writing (e.g. on a write error or Ctrl-C), so
+    # the receiver stops reading instead of waiting on a queue nobody drains.
+    stop = threading.Event()
+
+    def _receive(response):
+        try:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                if stop.is_set():
+                    return
+                chunks.put(chunk)
+        except Exception as e:
+            if not stop.is_set():
+                chunks.put(e)
+        else:
+            chunks.put(None)
+
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        receiver = threading.Thread(target=_receive, args=(response,), daemon=True)
+        receiver.start()
+        try:
+            while (chunk := chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                f.write(chunk)
+        finally:
+            stop.set()
+            # Free up the queue, so a receiver blocked on a full queue can put
+            # its last chunk, see the stop flag and exit:
+            while True:
+                try:
+                    chunks.get_nowait()
+                except queue.Empty:
+                    break
+            response.close()
+            receiver.join()
+
+
+def _graph_cache_path(graph_uri: str) -> pathlib.Path | None:
+    """
+    Get the on-disk cache location for a parsed local graph.
+
+    The cache file is named for the URI, followed by a key covering the size
+    and modification time of every file it reads, so editing any of them
+    invalidates the cached copy. Entries for the same URI share a prefix, so
+    stale ones can be found and removed.
+
+    Arguments:
+        graph_uri: The URI of the graph.
+
+    Returns:
+        The path of the cache file, or None if the graph can't be cached
+        (because it isn't backed by local files).
+
+    """
+    headered = _headered_edgelist_regex.match(graph_uri)
+    opencypher = _opencypher_graphpath_regex.match(graph_uri)
+    if headered is not None:
+        source_paths = [headered.group(3)]
+    elif opencypher is not None:
+        source_paths = opencypher.group(1).split(",") + opencypher.group(2).split(",")
+    else:
+        source_paths = [graph_uri]
+
+    key = hashlib.sha1()
+    for source_path in source_paths:
+        source = pathlib.Path(source_path)
+        if not source.is_file():
+            return None
+        stat = source.stat()
+        key.update(f"{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    uri_key = hashlib.sha1(graph_uri.encode()).hexdigest()
+    return pathlib.Path(cache_dir) / "grandlite" / f"{uri_key}-{key.hexdigest()}.pkl"
+
+
+def _write_graph_cache(cache_path: pathlib.Path, host_graph: nx.Graph):
+    """
+    Write a parsed graph to the on-disk cache, replacing older entries for the
+    same URI.
+
+    Failing to write the cache only warns, since the graph is already loaded.
+
+    Arguments:
+        cache_path: The path of the cache file, from `_graph_cache_path`.
+        host_graph: The parsed graph to cache.
+
+    """
+    # Write to a temporary file first, so that an interrupted write never
+    # leaves a truncated cache entry behind:
+    partial_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(partial_path, "wb") as f:
+            pickle.dump(host_graph, f, protocol=5)
+        os.replace(partial_path, cache_path)
+    except OSError as e:
+        warnings.warn(f"Could not cache the parsed graph: {e}")
+        with contextlib.suppress(OSError):
+            partial_path.unlink(missing_ok=True)
+        return
+
+    # Entries for earlier versions of the same file(s) can never be hit again:
+    uri_key = cache_path.name.split("-")[0]
+    for stale_path in cache_path.parent.glob(f"{uri_key}-*.pkl"):
+        if stale_path != cache_path:
+            with contextlib.suppress(OSError):
+                stale_path.unlink()
+
+
+def detect_and_load_graph(graph_uri: str, cache: bool = False) -> nx.Graph:
     """
     Read a graph from its URI and return a NetworkX.Graph-compatible API.
 
@@ -157,6 +529,9 @@ def detect_and_load_graph(graph_uri: str) -> nx.Graph:
 
     Arguments:
         graph_uri: The URI of the graph.
+        cache: Whether to keep a pickled copy of the parsed graph on disk, and
+            load from it on later calls if the source files are unchanged.
+            Remote graphs are never cached.
 
     Returns:
         A NetworkX.Graph-compatible API.
@@ -166,10 +541,28 @@ def detect_and_load_graph(graph_uri: str) -> nx.Graph:
 
     """
 
-    if graph_uri.startswith("http://") or graph_uri.startswith("https://"):
+    import networkx as nx
+
+    cache_path = None
+    if cache and not graph_uri.startswith(("http://", "https://")):
+        cache_path = _graph_cache_path(graph_uri)
+    if cache_path is not None and cache_path.exists():
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            # The cache is best-effort: an unreadable or corrupt entry (e.g.
+            # one pickled by another networkx version) is just re-parsed.
+            pass
+
+    if graph_uri.startswith(("http://", "https://")):
+        # Unpickling can run arbitrary code, so never unpickle downloads. (The
+        # download itself has no suffix, and pickles are never sniffed.)
+        if _type_from_ext(graph_uri) == "gpickle":
+            raise ValueError("Refusing to load a pickled graph from a URL.")
         # Download to a temp file:
         with tempfile.NamedTemporaryFile(delete=False) as f:
-            f.write(requests.get(graph_uri).content)
+            _download_to_file(graph_uri, f)
             f.flush()
             graph_uri = f.name
 
@@ -178,24 +571,14 @@ def detect_and_load_graph(graph_uri: str) -> nx.Graph:
     #     graph_path = str(pathlib.Path(graph_uri).absolute().resolve())
     # else:
     graph_path = graph_uri
-    graph_type = None
-    if graph_path.endswith(".gml") or graph_path.endswith(".gml.gz"):
-        graph_type = "gml"
-    elif graph_path.endswith(".graphml") or graph_path.endswith(".graphml.gz"):
-        graph_type = "graphml"
-    elif graph_path.endswith(".gpickle"):
-        graph_type = "gpickle"
-    elif graph_path.startswith("edgelist://"):
-        graph_type = "edgelist"
-    elif graph_path.startswith("h-edgelist("):
-        graph_type = "edgelist-with-headers"
-
+    graph_type = _type_from_ext(graph_path)
     if graph_type is None:
         graph_type = _infer_graph_filetype_from_contents(graph_path)
 
     readers = {
-        "gml": nx.read_gml,  # type: ignore
+        "gml": read_gml,  # type: ignore
         "graphml": nx.read_graphml,  # type: ignore
+        "gpickle": read_gpickle,  # type: ignore
         "opencypher": read_opencypher,  # type: ignore
         "edgelist": nx.read_edgelist,  # type: ignore
         "edgelist-with-headers": read_headered_edgelist,  # type: ignore
@@ -203,7 +586,17 @@ def detect_and_load_graph(graph_uri: str) -> nx.Graph:
     if graph_type not in readers:
         raise ValueError(f"Unknown graph file type for file '{graph_path}'.")
 
-    host_graph = readers[graph_type](graph_path)
+    if (
+        not graph_path.endswith(".gz")
+        and pathlib.Path(graph_path).is_file()
+        and _read_head(graph_path, 2) == _GZIP_MAGIC
+    ):
+        # The NetworkX readers only decompress files named `.gz`, so hand them
+        # a decompressing file object instead:
+        with gzip.open(graph_path, "rb") as f:
+            host_graph = readers[graph_type](f)
+    else:
+        host_graph = readers[graph_type](graph_path)
     # Parse __labels__ attributes as CSV and convert to set
     for nid, node_attrs in host_graph.nodes(data=True):
         if "__labels__" in node_attrs:
@@ -213,10 +606,69 @@ def detect_and_load_graph(graph_uri: str) -> nx.Graph:
         if "__labels__" in edge_attrs:
             edge_attrs["__labels__"] = parse_labels_attribute(edge_attrs["__labels__"])
 
+    if cache_path is not None:
+        _write_graph_cache(cache_path, host_graph)
+
     return host_graph
 
 
-def prompt_loop_on_graph(host_graph: nx.Graph, query_language: str = "cypher"):
+def _run_piped_queries(stateful_prompt: StatefulPrompt):
+    """
+    Run queries read from a non-interactive stdin.
+
+    Each line is one query, or each blank-line-separated block for multiline
+    languages such as DotMotif. Output goes to stdout and errors to stderr.
+
+    Arguments:
+        stateful_prompt: The prompt to submit the queries to.
+
+    """
+    if stateful_prompt.prompt_kwargs().get("multiline"):
+        inputs = re.split(r"\n\s*\n", sys.stdin.read())
+    else:
+        inputs = sys.stdin
+    for text in inputs:
+        text = text.strip()
+        if not text:
+            continue
+        if text.lower() in _EXIT_TOKENS:
+            break
+        output, error = stateful_prompt.submit_input(text)
+        if error is not None:
+            print(error, file=sys.stderr)
+        elif output is not None:
+            print(output)
+
+
+def _response_fragments(output: str | None, error: str | None) -> list:
+    """
+    Build the styled text for a prompt's response, so that it can be printed
+    (and flushed) in a single call.
+
+    The text is styled as fragments rather than HTML, so results that contain
+    characters such as '<' or '&' are printed as-is.
+
+    Arguments:
+        output: The output of the submitted input, if any.
+        error: The error from the submitted input, if any.
+
+    Returns:
+        A list of (style, text) fragments; empty if there is nothing to print.
+
+    """
+    fragments = []
+    if error is not None:
+        fragments.append(("ansired", error))
+    if output is not None:
+        if fragments:
+            fragments.append(("", "\n"))
+        fragments.append(("ansigreen", output))
+    return fragments
+
+
+def prompt_loop_on_graph(
+    host_graph: nx.Graph, query_language: str = "cypher", limit: int | None = None
+):
     """
     A prompt loop that allows the user to query a graph using a query language
     of their choice.
@@ -225,14 +677,27 @@ def prompt_loop_on_graph(host_graph: nx.Graph, query_language: str = "cypher"):
         host_graph: The graph to query.
         query_language: The query language to use. Currently supported are
             'cypher' and 'dotmotif'.
+        limit: The maximum number of results to return from each query, or
+            None for no limit.
 
     """
-    session = PromptSession(enable_history_search=True)
-
     if query_language not in ALL_PROMPTS:
         raise ValueError(f"No known query parser for language '{query_language}'.")
 
-    stateful_prompt: StatefulPrompt = ALL_PROMPTS[query_language](host_graph)
+    stateful_prompt: StatefulPrompt = ALL_PROMPTS[query_language](
+        host_graph, limit=limit
+    )
+
+    if not sys.stdin.isatty():
+        # Queries are being piped in, so skip prompt_toolkit's interactive
+        # session entirely:
+        _run_piped_queries(stateful_prompt)
+        return
+
+    from prompt_toolkit import PromptSession, print_formatted_text
+    from prompt_toolkit.formatted_text import FormattedText
+
+    session = PromptSession(enable_history_search=True)
 
     exiting = False
     while not exiting:
@@ -240,7 +705,7 @@ def prompt_loop_on_graph(host_graph: nx.Graph, query_language: str = "cypher"):
             text = session.prompt(
                 stateful_prompt.prompt_text(),
                 **stateful_prompt.prompt_kwargs(),
-                bottom_toolbar=stateful_prompt.bottom_toolbar(),
+                bottom_toolbar=stateful_prompt.bottom_toolbar,
             )
         except KeyboardInterrupt:
             continue
@@ -248,26 +713,40 @@ def prompt_loop_on_graph(host_graph: nx.Graph, query_language: str = "cypher"):
             exiting = True
             continue
 
-        if text.lower() in [
-            "exit",
-            "exit()",
-            "quit",
-            "quit()",
-            "q",
-        ]:
+        stripped = text.strip()
+        if not stripped:
+            continue
+        if stripped.lower() in _EXIT_TOKENS:
             exiting = True
             continue
 
         output, error = stateful_prompt.submit_input(text)
-        if error is not None:
-            print_formatted_text(
-                HTML(f"<ansired>{error}</ansired>"),
-            )
-            continue
-        if output is not None:
-            print_formatted_text(
-                HTML(f"<ansigreen>{output}</ansigreen>"),
-            )
+        fragments = _response_fragments(output, error)
+        if fragments:
+            print_formatted_text(FormattedText(fragments))
+
+
+def _positive_int(value: str) -> int:
+    """
+    Parse a command-line argument as an integer of at least 1.
+
+    Arguments:
+        value: The argument as given on the command line.
+
+    Returns:
+        The parsed integer.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a positive integer.
+
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, not '{value}'")
+    return number
 
 
 def cli():
@@ -306,6 +785,19 @@ def cli():
         choices=["cypher", "dotmotif"],
         default=None,
     )
+    # Cache the parsed graph on disk to skip parsing on later runs.
+    argparser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Cache the parsed graph on disk and reuse it while the file is unchanged.",
+    )
+    # Bound the number of results returned by each query.
+    argparser.add_argument(
+        "--limit",
+        type=_positive_int,
+        help="The maximum number of results to return from each query.",
+        default=None,
+    )
     # Print statistics about the graph and exit.
     argparser.add_argument(
         "--stats",
@@ -319,7 +811,10 @@ def cli():
     )
 
     args = argparser.parse_args()
-    host_graph = detect_and_load_graph(args.graph)
+
+    import networkx as nx
+
+    host_graph = detect_and_load_graph(args.graph, args.cache)
     language = args.language or "cypher"
 
     if args.stats:
@@ -364,17 +859,25 @@ def cli():
 
     if args.query is not None:
         try:
-            results = ALL_PROMPTS[language](host_graph).query(args.query)
+            stateful_prompt = ALL_PROMPTS[language](host_graph, limit=args.limit)
+            if args.output == "csv":
+                # CSV rows are streamed straight to stdout, without building a
+                # DataFrame first:
+                columns, records = stateful_prompt.records(args.query)
+            else:
+                results = stateful_prompt.query(args.query)
         except Exception as e:
             print(e)
             sys.exit(1)
 
-        if args.output is None:
+        if args.output == "csv":
+            _write_csv_records(columns, records)
+        elif args.output is None:
             print(results)
         else:
             results_formatter[args.output](results)
     else:
-        prompt_loop_on_graph(host_graph, language)
+        prompt_loop_on_graph(host_graph, language, limit=args.limit)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,390 @@
-import datetime
-from typing import Any, Protocol
+from __future__ import annotations
 
-import networkx as nx
-import pandas as pd
-from dotmotif import GrandIsoExecutor, Motif
-from grandcypher import GrandCypher
-from prompt_toolkit import HTML
+import datetime
+import functools
+import re
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Iterator, Protocol
 
 from .types import Response
 
+if TYPE_CHECKING:
+    import networkx as nx
+
+_cypher_limit_regex = re.compile(r"\bLIMIT\s+\d+\s*$", re.IGNORECASE)
+
+# The query engines and prompt_toolkit are imported where they are first used,
+# so that loading grandlite (e.g. for `--help`) does not pay for them.
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_cypher(query: str):
+    """
+    Parse a Cypher query, memoizing the parse tree per unique query string.
+    """
+    from grandcypher import _GrandCypherGrammar
+
+    return _GrandCypherGrammar.parse(query)
+
+
+def _run_cypher(graph: nx.Graph, query: str) -> dict:
+    """
+    Run a Cypher query against a graph, reusing the cached parse tree.
+
+    A fresh transformer is built for every run, since GrandCypher's transformer
+    accumulates match state and cannot safely be reused between queries.
+    """
+    try:
+        from grandcypher import _GrandCypherTransformer
+    except ImportError:  # Internals moved; parse on every run instead.
+        from grandcypher import GrandCypher
+
+        return GrandCypher(graph).run(query)
+    transformer = _GrandCypherTransformer(graph)
+    transformer.transform(_parse_cypher(query))
+    return transformer.returns()
+
+
+def _arrow_table(results):
+    """
+    Convert a results DataFrame to a pyarrow Table, without its index.
+
+    Arguments:
+        results: The results DataFrame to convert.
+
+    Returns:
+        The Arrow table, or None if pyarrow is not installed or can't represent
+        the frame (for example, columns that mix types or hold dicts).
+
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+
+    try:
+        return pa.Table.from_pandas(results, preserve_index=False)
+    except pa.ArrowException:
+        return None
+
+
+def _fast_to_csv(results, filename: str, table=None):
+    """
+    Write a results DataFrame to a CSV file, without its index.
+
+    Uses Arrow's C++ CSV writer when the frame converts to Arrow and the writer
+    supports all of its column types, falling back to pandas otherwise.
+
+    Arguments:
+        results: The results DataFrame to write.
+        filename: The path of the CSV file to write.
+        table: The results already converted by `_arrow_table`, if available.
+
+    """
+    if table is None:
+        table = _arrow_table(results)
+    if table is None:
+        results.to_csv(filename, index=False)
+        return
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    try:
+        pacsv.write_csv(table, filename)
+    except pa.ArrowException:
+        # Arrow's CSV writer has no representation for nested types such as
+        # structs (e.g. edge attribute dicts), which pandas writes as text:
+        results.to_csv(filename, index=False)
+
+
+def _fast_to_parquet(results, filename: str, table=None):
+    """
+    Write a results DataFrame to a Parquet file, without its index.
+
+    Writes the Arrow table directly when the frame converts to Arrow, falling
+    back to pandas (and its own Parquet engine lookup) otherwise.
+
+    Arguments:
+        results: The results DataFrame to write.
+        filename: The path of the Parquet file to write.
+        table: The results already converted by `_arrow_table`, if available.
+
+    """
+    if table is None:
+        table = _arrow_table(results)
+    if table is None:
+        results.to_parquet(filename, index=False)
+        return
+    import pyarrow.parquet as pq
+
+    pq.write_table(table, filename)
+
+
+def _json_default(value):
+    # Serialize sets (e.g. `__labels__`) as lists, as pandas does.
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError
+
+
+def _fast_to_json(results, path_or_buf, lines: bool = False):
+    """
+    Write a results DataFrame as a list of JSON records, or as JSON Lines.
+
+    Uses orjson when it is installed, falling back to pandas when it isn't or
+    when orjson can't serialize one of the values.
+
+    Arguments:
+        results: The results DataFrame to write.
+        path_or_buf: The path of the file to write, or a binary file object.
+        lines: Whether to write one record per line (JSON Lines).
+
+    """
+    try:
+        import orjson
+
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        records = results.to_dict(orient="records")
+        if lines:
+            body = b"".join(
+                orjson.dumps(record, default=_json_default, option=option) + b"\n"
+                for record in records
+            )
+        else:
+            body = orjson.dumps(records, default=_json_default, option=option)
+    except (ImportError, TypeError):
+        body = results.to_json(orient="records", lines=lines).encode()
+
+    if isinstance(path_or_buf, str):
+        with open(path_or_buf, "wb") as f:
+            f.write(body)
+    else:
+        path_or_buf.write(body)
+
+
+# A mapping of file extensions to functions that write a results DataFrame to
+# a file with that extension.
+_RESULT_SAVERS = {
+    "csv": _fast_to_csv,
+    "jsonl": functools.partial(_fast_to_json, lines=True),
+    "json": _fast_to_json,
+    "md": lambda df, filename: df.to_markdown(filename),
+    "markdown": lambda df, filename: df.to_markdown(filename),
+    "html": lambda df, filename: df.to_html(filename),
+    "parquet": _fast_to_parquet,
+    "feather": lambda df, filename: df.to_feather(filename),
+}
+
+# Formats whose savers write an Arrow table, and so take a `table` argument.
+_ARROW_FORMATS = frozenset({"csv", "parquet"})
+
+# The number of result rows rendered after a query; `show N` renders more.
+_PREVIEW_ROWS = 200
+
+# What is rendered in place of a table when a query matches nothing.
+_NO_ROWS = "(no rows)"
+
+
+def _render_results(results, rows: int = _PREVIEW_ROWS) -> str:
+    """
+    Render the first rows of a results DataFrame as a markdown table.
+
+    Only the rendered rows are formatted, so the cost of displaying a result
+    does not grow with its size. Empty results are not formatted at all.
+
+    Arguments:
+        results: The results DataFrame to render.
+        rows: The maximum number of rows to render.
+
+    Returns:
+        The rendered table, with a note of the total row count if truncated.
+
+    """
+    if len(results) == 0:
+        return _NO_ROWS
+    if len(results) <= rows:
+        return results.to_markdown()
+    return (
+        results.head(rows).to_markdown()
+        + f"\n… ({len(results)} rows total; use 'show N' to see more, "
+        + "or 'save' to export)"
+    )
+
+
+def _command_word(input_text: str) -> str:
+    """
+    Get the first word of an input, lowercased, to match it against commands.
+    """
+    words = input_text.split(maxsplit=1)
+    return words[0].lower() if words else ""
+
+
+def _handle_show(results, input_text: str) -> Response:
+    """
+    Handle a `show [N]` command, rendering the first N rows of the results.
+
+    Arguments:
+        results: The last results DataFrame, or None if there are none.
+        input_text: The full command text.
+
+    Returns:
+        The rendered rows, or an error.
+
+    """
+    if results is None:
+        return None, "No results to show."
+    args = input_text.split()[1:]
+    if len(args) == 0:
+        return _render_results(results, len(results)), None
+    try:
+        rows = int(args[0])
+    except ValueError:
+        rows = 0
+    if rows < 1:
+        return None, f"Invalid number of rows: {args[0]}"
+    return _render_results(results, rows), None
+
+
+def _handle_save(results, input_text: str, arrow_table=None) -> Response:
+    """
+    Handle a `save [FILENAME]` command, writing the results to a file.
+
+    The format is taken from the filename's extension. If no filename is
+    given, the results are saved as JSON to a timestamped file.
+
+    Arguments:
+        results: The last results DataFrame, or None if there are none.
+        input_text: The full command text.
+        arrow_table: A function returning the results converted to Arrow, so
+            that the caller can convert each result set only once. Called
+            only when saving to a format written from Arrow.
+
+    Returns:
+        A message naming the saved file, or an error.
+
+    """
+    if results is None:
+        return None, "No results to save."
+    args = input_text.split()[1:]
+    if len(args) > 0:
+        fmt = args[0].split(".")[-1]
+        filename = args[0]
+    else:
+        fmt = "json"
+        iso = datetime.datetime.now().isoformat()
+        filename = f"results-{iso}.{fmt}"
+
+    saver = _RESULT_SAVERS.get(fmt)
+    if saver is None:
+        return None, f"Unknown format: {fmt}"
+    try:
+        if fmt in _ARROW_FORMATS and arrow_table is not None:
+            saver(results, filename, table=arrow_table())
+        else:
+            saver(results, filename)
+    except Exception as e:
+        return None, str(e)
+    return f"Saved results to {filename}.", None
+
+
+def _results_to_dataframe(results):
+    """
+    Build a results DataFrame from an engine's raw results.
+
+    GrandCypher returns a dict of columns, which pandas takes as-is. DotMotif
+    returns a list of row dicts, which pandas transposes in C; transposing them
+    in Python first was measured to be no faster.
+
+    Arguments:
+        results: A dict of columns, or a list of row dicts.
+
+    Returns:
+        The results as a DataFrame.
+
+    """
+    import pandas as pd
+
+    if isinstance(results, dict):
+        return pd.DataFrame.from_dict(results)
+    return pd.DataFrame(results)
+
+
+class _ResultCache:
+    """
+    A small LRU cache of query results, keyed by query text.
+
+    Only leading and trailing whitespace is ignored. Whitespace inside a query
+    can be part of a string literal, so queries that differ anywhere else get
+    their own entries.
+
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self._maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return query.strip()
+
+    def get(self, query: str) -> Any:
+        key = self._key(query)
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, query: str, results: Any):
+        key = self._key(query)
+        self._entries[key] = results
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _render_toolbar(language: str, n_nodes: int, n_edges: int, results):
+    """
+    Render the bottom toolbar shown beneath a prompt.
+
+    Arguments:
+        language: The display name of the query language.
+        n_nodes: The number of nodes in the graph.
+        n_edges: The number of edges in the graph.
+        results: The last results DataFrame, or None if there are none.
+
+    Returns:
+        The toolbar, as prompt_toolkit HTML.
+
+    """
+    from prompt_toolkit import HTML
+
+    return HTML(
+        f"Language: <b>{language}</b>    "
+        f"Vertices: <b>{n_nodes}</b>    "
+        f"Edges: <b>{n_edges}</b>    "
+        + (f"Last results: <b>{len(results)}</b>" if results is not None else "")
+    )
+
+
+def _with_cypher_limit(query: str, limit: int | None) -> str:
+    """
+    Append a LIMIT clause to a Cypher query that does not already end in one.
+
+    Arguments:
+        query: The Cypher query.
+        limit: The maximum number of rows to return, or None for no limit.
+
+    Returns:
+        The query, bounded to at most `limit` rows.
+
+    """
+    if limit is None or _cypher_limit_regex.search(query):
+        return query
+    return f"{query.rstrip()} LIMIT {limit}"
+
 
 class StatefulPrompt(Protocol):
     """
@@ -42,6 +418,15 @@ class StatefulPrompt(Protocol):
         """
         ...
 
+    def records(self, input_text: str) -> tuple[list[str], Iterator[dict]]:
+        """
+        Perform a single query, returning the result's column names and an
+        iterator of result rows as dicts.
+
+        The column names are known even when there are no rows.
+        """
+        ...
+
     def submit_input(self, input_text: str) -> Response:
         """
         Submit the given input to the prompt.
@@ -64,15 +449,26 @@ class GrandCypherStatefulPrompt(StatefulPrompt):
 
     """
 
-    def __init__(self, graph_pointer: nx.Graph):
+    def __init__(self, graph_pointer: nx.Graph, limit: int | None = None):
         """
         Initialize the prompt with a graph pointer.
 
         Arguments:
             graph_pointer: A NetworkX graph pointer.
+            limit: The maximum number of rows a query returns, unless the
+                query has its own LIMIT clause. Defaults to no limit.
 
         """
         self._graph = graph_pointer
+        self._limit = limit
+        self._cache = _ResultCache()
+        # The prompts never mutate the graph, so its size is counted only once
+        # rather than on every toolbar refresh.
+        self._n_nodes = graph_pointer.number_of_nodes()
+        self._n_edges = graph_pointer.number_of_edges()
+        self._toolbar = None
+        self._toolbar_results = None
+        self._last_table = None
         self._last_results = None
 
     def _get_state(self):
@@ -92,54 +488,52 @@ class GrandCypherStatefulPrompt(StatefulPrompt):
         return {}
 
     def bottom_toolbar(self):
-        return HTML(
-            f"Language: <b>Cypher</b>    "
-            f"Vertices: <b>{len(self._graph.nodes)}</b>    "
-            f"Edges: <b>{len(self._graph.edges)}</b>    "
-            + (
-                f"Last results: <b>{len(self._last_results)}</b>"
-                if self._last_results is not None
-                else ""
+        # Only rebuild the toolbar when the results it reports have changed:
+        if self._toolbar is None or self._toolbar_results is not self._last_results:
+            self._toolbar = _render_toolbar(
+                "Cypher", self._n_nodes, self._n_edges, self._last_results
             )
-        )
+            self._toolbar_results = self._last_results
+        return self._toolbar
+
+    def _results_table(self):
+        # Convert the last results to Arrow at most once, however many times
+        # (and to however many files) they are saved:
+        if self._last_table is None or self._last_table[0] is not self._last_results:
+            self._last_table = (self._last_results, _arrow_table(self._last_results))
+        return self._last_table[1]
 
     def query(self, input_text: str) -> Any:
-        results = GrandCypher(self._graph).run(input_text)
-        return pd.DataFrame(results)
+        cached = self._cache.get(input_text)
+        if cached is not None:
+            return cached
+        query = _with_cypher_limit(input_text, self._limit)
+        results = _results_to_dataframe(_run_cypher(self._graph, query))
+        self._cache.put(input_text, results)
+        return results
+
+    def records(self, input_text: str) -> tuple[list[str], Iterator[dict]]:
+        query = _with_cypher_limit(input_text, self._limit)
+        results = _run_cypher(self._graph, query)
+        columns = list(results.keys())
+        return columns, (dict(zip(columns, row)) for row in zip(*results.values()))
 
     def submit_input(self, input_text: str) -> Response:
-        if input_text.lower().startswith("save"):
-            if self._last_results is None:
-                return None, "No results to save."
-            args = input_text.split(" ")[1:]
-            if len(args) > 0:
-                format = args[0].split(".")[-1]
-                filename = args[0]
-            else:
-                format = "json"
-                iso = datetime.datetime.now().isoformat()
-                filename = f"results-{iso}.{format}"
-
-            if format == "csv":
-                self._last_results.to_csv(filename)
-            elif format == "jsonl":
-                self._last_results.to_json(filename, orient="records", lines=True)
-            elif format == "json":
-                self._last_results.to_json(filename, orient="records")
-            elif format in ["md", "markdown"]:
-                self._last_results.to_markdown(filename)
-            elif format == "html":
-                self._last_results.to_html(filename)
-            else:
-                return None, f"Unknown format: {format}"
-            return f"Saved results to {filename}.", None
+        if input_text.strip().lower() == "cache clear":
+            self._cache.clear()
+            return "Cleared cached results.", None
+
+        if _command_word(input_text) == "save":
+            return _handle_save(self._last_results, input_text, self._results_table)
+
+        if _command_word(input_text) == "show":
+            return _handle_show(self._last_results, input_text)
 
         try:
-            results = GrandCypher(self._graph).run(input_text)
-            self._last_results = pd.DataFrame(results)
+            self._last_results = self.query(input_text)
         except Exception as e:
             return None, str(e)
-        return self._last_results.to_markdown(), None
+        return _render_results(self._last_results), None
 
 
 class DotMotifStatefulPrompt(StatefulPrompt):
@@ -152,8 +546,19 @@ class DotMotifStatefulPrompt(StatefulPrompt):
 
     """
 
-    def __init__(self, graph_pointer: nx.Graph):
+    def __init__(self, graph_pointer: nx.Graph, limit: int | None = None):
+        from dotmotif import GrandIsoExecutor
+
         self._graph = graph_pointer
+        self._limit = limit
+        # The executor holds no per-query state, so one is shared by all runs.
+        self._executor = GrandIsoExecutor(graph=self._graph)
+        self._cache = _ResultCache()
+        self._n_nodes = graph_pointer.number_of_nodes()
+        self._n_edges = graph_pointer.number_of_edges()
+        self._toolbar = None
+        self._toolbar_results = None
+        self._last_table = None
         self._last_results = None
         self._first_prompt = True
 
@@ -176,57 +581,62 @@ class DotMotifStatefulPrompt(StatefulPrompt):
         return {"multiline": True}
 
     def bottom_toolbar(self):
-        return HTML(
-            f"Language: <b>DotMotif</b>    "
-            f"Vertices: <b>{len(self._graph.nodes)}</b>    "
-            f"Edges: <b>{len(self._graph.edges)}</b>    "
-            + (
-                f"Last results: <b>{len(self._last_results)}</b>"
-                if self._last_results is not None
-                else ""
+        # Only rebuild the toolbar when the results it reports have changed:
+        if self._toolbar is None or self._toolbar_results is not self._last_results:
+            self._toolbar = _render_toolbar(
+                "DotMotif", self._n_nodes, self._n_edges, self._last_results
             )
-        )
+            self._toolbar_results = self._last_results
+        return self._toolbar
+
+    def _results_table(self):
+        # Convert the last results to Arrow at most once, however many times
+        # (and to however many files) they are saved:
+        if self._last_table is None or self._last_table[0] is not self._last_results:
+            self._last_table = (self._last_results, _arrow_table(self._last_results))
+        return self._last_table[1]
 
     def query(self, input_text: str) -> Any:
-        results = GrandIsoExecutor(graph=self._graph).find(Motif(input_text))
-        return pd.DataFrame(results)
+        from dotmotif import Motif
+
+        cached = self._cache.get(input_text)
+        if cached is not None:
+            return cached
+        motif = Motif(input_text)
+        matches = self._executor.find(motif, limit=self._limit)
+        if not matches:
+            # Keep the motif's nodes as columns, as `records()` does, so that
+            # saving an empty result still writes a header:
+            matches = {node: [] for node in motif.to_nx().nodes}
+        results = _results_to_dataframe(matches)
+        self._cache.put(input_text, results)
+        return results
+
+    def records(self, input_text: str) -> tuple[list[str], Iterator[dict]]:
+        from dotmotif import Motif
+
+        motif = Motif(input_text)
+        # Each match maps every motif node to a host node, in motif order:
+        columns = list(motif.to_nx().nodes)
+        return columns, iter(self._executor.find(motif, limit=self._limit))
 
     def submit_input(self, input_text: str) -> Response:
         self._first_prompt = False
-        if input_text.lower().startswith("save"):
-            # Choose the format from the filename provided:
-            if self._last_results is None:
-                return None, "No results to save."
-            args = input_text.split(" ")[1:]
-            if len(args) > 0:
-                fmt = args[0].split(".")[-1]
-                filename = args[0]
-            else:
-                fmt = "json"
-                iso = datetime.datetime.now().isoformat()
-                filename = f"results-{iso}.{fmt}"
-
-            # Write the file:
-            if fmt == "csv":
-                self._last_results.to_csv(filename)
-            elif fmt == "jsonl":
-                self._last_results.to_json(filename, orient="records", lines=True)
-            elif fmt == "json":
-                self._last_results.to_json(filename, orient="records")
-            elif fmt in ["md", "markdown"]:
-                self._last_results.to_markdown(filename)
-            elif fmt == "html":
-                self._last_results.to_html(filename)
-            else:
-                return None, f"Unknown format: {fmt}"
-            return f"Saved results to {filename}.", None
+        if input_text.strip().lower() == "cache clear":
+            self._cache.clear()
+            return "Cleared cached results.", None
+
+        if _command_word(input_text) == "save":
+            return _handle_save(self._last_results, input_text, self._results_table)
+
+        if _command_word(input_text) == "show":
+            return _handle_show(self._last_results, input_text)
 
         try:
-            results = GrandIsoExecutor(graph=self._graph).find(Motif(input_text))
-            self._last_results = pd.DataFrame(results)
+            self._last_results = self.query(input_text)
         except Exception as e:
             return None, str(e)
-        return self._last_results.to_markdown(), None
+        return _render_results(self._last_results), None
 
 
 # A mapping of query languages to their respective stateful prompts.